@@ -0,0 +1,77 @@
+"""
+Compare the full single-pass extraction with the two-phase flat search +
+lightweight stream resolution used by YTDLSource.from_query.
+
+Run from the repository root (needs network access):
+    python -m benchmarks.extract [--client NAME] [query ...]
+
+--client picks the YouTube player client of the lightweight profile
+(default: utils.ytdl.STREAM_PLAYER_CLIENT), to compare candidates.
+"""
+import argparse
+import statistics
+import time
+
+from yt_dlp import YoutubeDL
+
+from utils.ytdl import (
+    STREAM_PLAYER_CLIENT,
+    extract_flat,
+    resolve_stream,
+    stream_options,
+    ytdl,
+)
+
+DEFAULT_QUERIES = [
+    "rick astley never gonna give you up",
+    "daft punk around the world",
+    "queen bohemian rhapsody",
+]
+
+
+def full_extraction(query):
+    """The previous path: full search extraction with format selection."""
+    data = ytdl.extract_info(f"ytsearch:{query}", download=False)
+    return data["entries"][0]["url"]
+
+
+stream_ytdl = None
+
+
+def two_phase_extraction(query):
+    entry = extract_flat(query)
+    return resolve_stream(entry["url"], stream_ytdl)["url"]
+
+
+def measure(fn, query):
+    wall, cpu = time.perf_counter(), time.process_time()
+    fn(query)
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+
+def main():
+    global stream_ytdl
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--client", default=STREAM_PLAYER_CLIENT)
+    parser.add_argument("queries", nargs="*")
+    args = parser.parse_args()
+    stream_ytdl = YoutubeDL(stream_options(args.client))
+    queries = args.queries or DEFAULT_QUERIES
+    print(f"lightweight profile client: {args.client}")
+    results = {full_extraction: [], two_phase_extraction: []}
+    for query in queries:
+        # Alternate the order so neither path always gets the warm cache
+        for fn in (full_extraction, two_phase_extraction):
+            results[fn].append(measure(fn, query))
+        for fn in (two_phase_extraction, full_extraction):
+            results[fn].append(measure(fn, query))
+
+    print(f"{'path':<22} {'wall med s':>11} {'cpu med s':>10}")
+    for fn, samples in results.items():
+        wall = statistics.median(s[0] for s in samples)
+        cpu = statistics.median(s[1] for s in samples)
+        print(f"{fn.__name__:<22} {wall:>11.3f} {cpu:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
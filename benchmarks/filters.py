@@ -0,0 +1,51 @@
+"""
+Measure the FFmpeg CPU cost of every audio effect preset.
+
+Run from the repository root:
+    python -m benchmarks.filters [seconds]
+"""
+import resource
+import subprocess
+import sys
+
+from utils.filters import EFFECTS, SAMPLE_RATE, compile_filters
+
+
+def run_graph(graph, seconds):
+    """Decode `seconds` of a test tone through `graph` and return the CPU time used."""
+    args = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-f", "lavfi",
+        "-i", f"sine=frequency=440:sample_rate=44100:duration={seconds}",
+    ]
+    if graph:
+        args += ["-af", graph]
+    args += ["-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "2", "-"]
+
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    subprocess.run(args, stdout=subprocess.DEVNULL, check=True)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    cases = {"none": ()}
+    cases.update({name: (name,) for name in EFFECTS})
+    cases["nightcore+bassboost"] = ("nightcore", "bassboost")
+    cases["vaporwave+8d+speed1.5"] = ("vaporwave", "8d")
+
+    baseline = run_graph(None, seconds)
+    print(f"{'preset':<24} {'cpu s':>8} {'vs none':>8}  graph")
+    for label, effects in cases.items():
+        speed = 1.5 if "speed" in label else 1.0
+        graph = compile_filters(effects, speed)
+        cpu = run_graph(graph, seconds)
+        ratio = cpu / baseline if baseline else 0.0
+        print(f"{label:<24} {cpu:>8.3f} {ratio:>7.2f}x  {graph or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare the memory held per active guild when a player keeps the full
+yt-dlp info dict versus the compact TrackInfo record.
+
+Each form is measured in its own process, since RSS does not shrink
+reliably after objects are freed. Run from the repository root (needs
+network access):
+    python -m benchmarks.memory [--guilds N] [query ...]
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+from utils.ytdl import TrackInfo, extract_flat, resolve_stream
+
+DEFAULT_QUERIES = [
+    "rick astley never gonna give you up",
+    "daft punk around the world",
+    "queen bohemian rhapsody",
+]
+
+
+def rss_bytes():
+    """Resident set size of this process, from /proc."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def measure(mode, guilds, queries):
+    """Hold one current track per guild in `mode` form and return memory used."""
+    gc.collect()
+    base_rss = rss_bytes()
+    tracemalloc.start()
+
+    held = []
+    for i in range(guilds):
+        query = queries[i % len(queries)]
+        data = resolve_stream(extract_flat(query)["url"])
+        # Like from_query, the compact form drops the dict right away
+        held.append(data if mode == "dict" else TrackInfo.from_data(data))
+        del data
+
+    gc.collect()
+    traced = tracemalloc.get_traced_memory()[0]
+    return {"rss": rss_bytes() - base_rss, "traced": traced, "held": len(held)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--mode", choices=("dict", "info"))
+    parser.add_argument("queries", nargs="*")
+    args = parser.parse_args()
+    queries = args.queries or DEFAULT_QUERIES
+
+    if args.mode:
+        # Child process: measure one form and report it as JSON
+        print(json.dumps(measure(args.mode, args.guilds, queries)))
+        return
+
+    print(f"{args.guilds} guilds, {len(queries)} distinct tracks")
+    print(f"{'record':<10} {'RSS KB/guild':>13} {'traced KB/guild':>16}")
+    for mode, label in (("dict", "info dict"), ("info", "TrackInfo")):
+        out = subprocess.run(
+            [
+                sys.executable, "-m", "benchmarks.memory",
+                "--mode", mode, "--guilds", str(args.guilds), *queries,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        rss = result["rss"] / args.guilds / 1024
+        traced = result["traced"] / args.guilds / 1024
+        print(f"{label:<10} {rss:>13.1f} {traced:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,43 +2,87 @@ import discord
 import random
 import json
 import asyncio  # Import asyncio for locking
-from discord.ext import commands
+import time
+from discord.ext import commands, tasks
 from discord import app_commands
-from utils.ytdl import YTDLSource, ytdl
+from utils.ytdl import YTDLSource, ytdl, extract_flat
 from utils.spotify import SpotifyHelper
+from utils.library import Library, SavedTrack
+from utils.loudness import LoudnessAnalyzer, gain_for
+from utils.filters import EFFECTS, compile_filters
+from utils.metrics import metrics
+from utils.trackindex import TrackIndex
+from utils.ffmpeg import ProcessLimitError, supervisor
+from utils.governor import governor
+from utils.watchdog import LoopWatchdog
 
 # Load configuration from config.json
 with open("config.json") as f:
     cfg = json.load(f)
 
-# A dictionary of available audio filters and their ffmpeg options
-AUDIO_FILTERS = {
-    "none": None,
-    "bassboost": "bass=g=10",
-    "nightcore": "atempo=1.06,asetrate=44100*1.25",
-    "vaporwave": "asetrate=44100*0.8,aresample=44100,atempo=0.8",
-    "8d": "apulsator=hz=0.08",
-    "vibrato": "vibrato=f=6.5",
-    "tremolo": "tremolo",
-    "earrape": "acrusher=1:1:64:0:log",
-}
+
+class Replay:
+    """
+    Marks a queue entry that replays the current song (a /seek, /speed or
+    /filter reload, or loop mode), so it is not counted as a new play.
+    """
+
+    __slots__ = ("entry",)
+
+    def __init__(self, entry):
+        self.entry = entry
+
+    def __str__(self):
+        return str(self.entry)
 
 
 class Music(commands.Cog):
-    def __init__(self, bot, spotify_helper):
+    def __init__(self, bot, spotify_helper, library, normalize=True):
         self.bot = bot
         self.spotify_helper = spotify_helper
+        self.library = library
+        self.loudness = LoudnessAnalyzer(library) if normalize else None
         self.queues = {}
         self.current = {}
         self.history = {}
         self.loop_states = {}
         self.volumes = {}
         self.speeds = {}
-        self.filters = {}  # To store active filters
+        self.filters = {}  # To store the stack of active effects
         self.start_times = {}
         self.autoplay_states = {}  # To store autoplay states
         self.text_channels = {}  # To store the text channel for each guild
         self.locks = {}  # Dictionary to hold a lock for each guild
+        self.idle_tasks = {}  # Pending idle disconnects for each guild
+        self.last_active = {}  # When each guild's voice connection was last used
+        self.auto_paused = set()  # Guilds paused because the channel emptied
+        self.ffmpeg_waits = {}  # Guilds waiting for a free FFmpeg slot
+        # Most songs /saveplaylist stores, and how many it resolves at once
+        self.max_playlist_tracks = cfg.get("max_playlist_tracks", 1000)
+        self.resolve_concurrency = asyncio.Semaphore(8)
+        # Seconds to keep an idle voice connection open before leaving
+        self.idle_timeout = cfg.get("idle_timeout", 300)
+        # Voice connections per shard before idle ones are reclaimed (0 = no limit)
+        self.max_voice_connections = cfg.get("max_voice_connections", 0)
+        # Tracks known to /play autocomplete, seeded from the library
+        self.track_index = TrackIndex(cfg.get("autocomplete_tracks", 5000))
+        for track in library.recent_tracks(self.track_index.max_tracks):
+            self.track_index.add(track, played=False)
+        # Reports event loop stalls longer than this and who caused them
+        self.watchdog = LoopWatchdog(
+            threshold=cfg.get("stall_threshold_ms", 250) / 1000
+        )
+
+    async def cog_load(self):
+        self.supervise_ffmpeg.start()
+        self.govern_load.start()
+        self.watchdog.register(self)
+        self.watchdog.start()
+
+    async def cog_unload(self):
+        self.supervise_ffmpeg.cancel()
+        self.govern_load.cancel()
+        self.watchdog.stop()
 
     # --- Helper Methods ---
 
@@ -65,7 +109,7 @@ class Music(commands.Cog):
         self.volumes[gid] = vol
         vc = discord.utils.get(self.bot.voice_clients, guild__id=gid)
         if vc and vc.source:
-            vc.source.volume = vol
+            vc.source.volume = vol * getattr(vc.source, "gain", 1.0)
 
     def get_speed(self, gid):
         return self.speeds.get(gid, 1.0)
@@ -73,13 +117,21 @@ class Music(commands.Cog):
     def set_speed(self, gid, speed):
         self.speeds[gid] = speed
 
-    def get_filter(self, gid):
-        """Get the audio filter for a guild."""
-        return self.filters.get(gid)
-
-    def set_filter(self, gid, filter_name):
-        """Set the audio filter for a guild."""
-        self.filters[gid] = AUDIO_FILTERS.get(filter_name.lower())
+    def get_filters(self, gid):
+        """Get the stack of active audio effects for a guild."""
+        return self.filters.get(gid, ())
+
+    def toggle_filter(self, gid, filter_name):
+        """Add an effect to the guild's stack, or remove it if already active."""
+        name = filter_name.lower()
+        active = self.get_filters(gid)
+        if name == "none":
+            self.filters[gid] = ()
+        elif name in active:
+            self.filters[gid] = tuple(f for f in active if f != name)
+        elif name in EFFECTS:
+            self.filters[gid] = active + (name,)
+        return self.get_filters(gid)
 
     def get_autoplay(self, gid):
         """Get the autoplay state for a guild."""
@@ -89,6 +141,53 @@ class Music(commands.Cog):
         """Set the autoplay state for a guild."""
         self.autoplay_states[gid] = state
 
+    def apply_loudness(self, gid, player, query):
+        """Set the player's normalization gain, measuring the track if it is new."""
+        if not self.loudness:
+            return
+        video_id = player.info.id
+        if not video_id:
+            return
+
+        if getattr(query, "loudness", None) is not None:
+            measured = (query.loudness, query.peak)
+        else:
+            measured = self.library.get_loudness(video_id)
+        if measured is not None:
+            player.gain = gain_for(*measured)
+            return
+
+        def on_measured(lufs, peak):
+            # Apply the gain right away if the track is still playing
+            player.gain = gain_for(lufs, peak)
+            if self.current.get(gid) is player:
+                player.volume = self.get_vol(gid) * player.gain
+
+        self.loudness.schedule(
+            video_id, player.url, player.info.duration, on_measured
+        )
+
+    def passthrough_check(self, gid, query):
+        """
+        Return a check for whether a track may skip PCM processing under load.
+        Passthrough cannot apply volume or loudness gain, so it is only used
+        when both are about 1.0.
+        """
+        if not governor.passthrough or abs(self.get_vol(gid) - 1.0) > 0.01:
+            return None
+
+        def check(info):
+            if not self.loudness:
+                return True
+            if getattr(query, "loudness", None) is not None:
+                measured = (query.loudness, query.peak)
+            else:
+                measured = self.library.get_loudness(info.id) if info.id else None
+            # Unmeasured tracks need the PCM path to apply their gain later
+            return measured is not None and abs(gain_for(*measured) - 1.0) <= 0.01
+
+        return check
+
     def format_time(self, seconds):
         seconds = int(seconds)
         m, s = divmod(seconds, 60)
@@ -98,18 +197,126 @@ class Music(commands.Cog):
         else:
             return f"{m}:{s:02}"
 
+    def cleanup_guild(self, gid):
+        """Forget all playback state for a guild."""
+        for d in [
+            self.queues,
+            self.current,
+            self.history,
+            self.loop_states,
+            self.volumes,
+            self.filters,
+            self.autoplay_states,
+            self.start_times,
+            self.text_channels,
+            self.locks,  # Also clear the lock
+        ]:
+            d.pop(gid, None)
+
+    # --- Voice Connection Lifecycle ---
+
+    def start_idle(self, gid):
+        """Keep the voice connection open for the grace period, then leave."""
+        self.last_active[gid] = time.monotonic()
+        if gid in self.idle_tasks:
+            return
+        self.idle_tasks[gid] = self.bot.loop.create_task(self._idle_disconnect(gid))
+        metrics.gauge("voice.idle", len(self.idle_tasks))
+
+    def cancel_idle(self, gid):
+        """Mark a guild's connection as in use again, reusing it if it was idle."""
+        self.last_active[gid] = time.monotonic()
+        task = self.idle_tasks.pop(gid, None)
+        if task:
+            task.cancel()
+            metrics.incr("voice.reused")
+            metrics.gauge("voice.idle", len(self.idle_tasks))
+
+    async def _idle_disconnect(self, gid):
+        await asyncio.sleep(self.idle_timeout)
+        self.idle_tasks.pop(gid, None)
+        metrics.incr("voice.idle_timeouts")
+        await self.disconnect_guild(gid)
+
+    async def disconnect_guild(self, gid):
+        """Leave voice in a guild and drop its state."""
+        task = self.idle_tasks.pop(gid, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+        wait = self.ffmpeg_waits.pop(gid, None)
+        if wait:
+            wait.cancel()
+        metrics.gauge("voice.idle", len(self.idle_tasks))
+        self.last_active.pop(gid, None)
+        self.auto_paused.discard(gid)
+
+        vc = discord.utils.get(self.bot.voice_clients, guild__id=gid)
+        if vc:
+            self.get_queue(gid).clear()
+            vc.stop()
+            await vc.disconnect()
+        self.cleanup_guild(gid)
+
+    async def reclaim_voice_slot(self, guild):
+        """Free the least recently used idle connection if the shard is at its budget."""
+        if not self.max_voice_connections:
+            return
+        shard_vcs = [
+            vc for vc in self.bot.voice_clients if vc.guild.shard_id == guild.shard_id
+        ]
+        if len(shard_vcs) < self.max_voice_connections:
+            return
+        idle = [vc.guild.id for vc in shard_vcs if vc.guild.id in self.idle_tasks]
+        if not idle:
+            return
+        victim = min(idle, key=lambda g: self.last_active.get(g, 0))
+        metrics.incr("voice.reclaimed")
+        await self.disconnect_guild(victim)
+
     async def join_vc(self, inter):
+        gid = inter.guild.id
+        vc = inter.guild.voice_client
         if inter.user.voice:
             ch = inter.user.voice.channel
-            vc = inter.guild.voice_client
             if not vc or not vc.is_connected():
+                await self.reclaim_voice_slot(inter.guild)
                 vc = await ch.connect()
-            elif vc.channel != ch:
-                await vc.move_to(ch)
+                metrics.incr("voice.connects")
+                self.last_active[gid] = time.monotonic()
+            else:
+                # Only an idle bot follows the caller; never pull it out of a live session
+                busy = vc.is_playing() or vc.is_paused()
+                if vc.channel != ch and (gid in self.idle_tasks or not busy):
+                    await vc.move_to(ch)
+                self.cancel_idle(gid)
+            return vc
+        # Users outside voice can still add to a session that is in progress
+        if vc and vc.is_connected() and gid not in self.idle_tasks:
             return vc
         await inter.followup.send("Join a voice channel first.", ephemeral=True)
         return None
 
+    async def ensure_playing(self, inter):
+        """Join the user's channel and start or resume playback. Call with the guild lock held."""
+        gid = inter.guild.id
+        vc = await self.join_vc(inter)
+        if not vc:
+            return None
+
+        # Store the channel where the command was initiated
+        self.text_channels[gid] = inter.channel
+
+        if gid in self.auto_paused:
+            # Paused because the channel emptied, and someone is back
+            self.auto_paused.discard(gid)
+            if vc.is_paused():
+                vc.resume()
+
+        # If the bot isn't already playing, start the player.
+        if not vc.is_playing() and not vc.is_paused():
+            await self.play_next(gid, inter.channel)
+        return vc
+
     # --- Core Music Logic ---
 
     async def _find_related_song(self, title: str, history: list):
@@ -210,9 +417,9 @@ class Music(commands.Cog):
             self.text_channels[gid] = text_channel
 
         if loop_mode == "song" and self.current.get(gid) and not from_back:
-            queue.insert(0, self.current[gid].query)
+            queue.insert(0, Replay(self.current[gid].query))
         elif loop_mode == "queue" and self.current.get(gid) and not from_back:
-            queue.append(self.current[gid].query)
+            queue.append(Replay(self.current[gid].query))
 
         if not queue:
             if autoplay_mode and self.current.get(gid):
@@ -233,25 +440,41 @@ class Music(commands.Cog):
                             "Autoplay could not find a unique related song. Queue finished."
                         )
                     if vc:
-                        await vc.disconnect()
+                        self.start_idle(gid)
                     return
             else:
                 self.current.pop(gid, None)
                 if text_channel and not autoplay_mode:
                     await text_channel.send(
-                        "Looks like my job here is done, leaving now."
+                        "Looks like my job here is done. I'll stick around for a bit in case you want more."
                     )
                 if vc:
-                    await vc.disconnect()
+                    self.start_idle(gid)
                 return
 
         if vc:
+            self.cancel_idle(gid)
+            if not supervisor.has_capacity(gid):
+                # Check before extracting so a full host does not drain the queue
+                await self.wait_for_ffmpeg(gid, text_channel)
+                return
             query = queue.pop(0)
+            replay = isinstance(query, Replay)
+            if replay:
+                query = query.entry
             try:
-                speed = self.get_speed(gid)
-                audio_filter = self.get_filter(gid)
+                # Under load the governor drops expensive effects for new tracks
+                audio_filter = compile_filters(
+                    governor.effects(self.get_filters(gid)), self.get_speed(gid)
+                )
+                # Saved tracks are already resolved, so skip the search step
+                source_query = query.url if isinstance(query, SavedTrack) else query
                 player = await YTDLSource.from_query(
-                    query, loop=self.bot.loop, speed=speed, filter_options=audio_filter
+                    source_query,
+                    loop=self.bot.loop,
+                    filter_options=audio_filter,
+                    gid=gid,
+                    passthrough=self.passthrough_check(gid, query),
                 )
                 if player is None:
                     if text_channel:
@@ -259,7 +482,12 @@ class Music(commands.Cog):
                     await self.play_next(gid, text_channel)
                     return
 
-                player.volume = self.get_vol(gid)
+                track = player.info.to_saved_track()
+                if track and not replay:
+                    # Cache every new track so the autocomplete index survives restarts
+                    self.library.remember_track(track)
+                self.apply_loudness(gid, player, query)
+                player.volume = self.get_vol(gid) * player.gain
                 vc.play(
                     player,
                     after=lambda e: self.bot.loop.call_soon_threadsafe(
@@ -267,9 +495,12 @@ class Music(commands.Cog):
                         self.play_next(gid, self.text_channels.get(gid)),
                     ),
                 )
+                self.apply_bitrate(vc)
                 self.current[gid] = player
                 player.query = query
                 self.get_history(gid).append(player.title)
+                if track:
+                    self.track_index.add(track, gid, played=not replay)
                 self.start_times[gid] = discord.utils.utcnow().timestamp()
 
                 if text_channel:
@@ -278,6 +509,10 @@ class Music(commands.Cog):
                     if "Autoplaying" not in last_message.content:
                         await text_channel.send(f"Started playing: **{player.title}**.")
 
+            except ProcessLimitError:
+                # Another guild took the last slot while we were extracting
+                queue.insert(0, Replay(query) if replay else query)
+                await self.wait_for_ffmpeg(gid, text_channel)
             except Exception as e:
                 print(f"Error playing {query}: {e}")
                 if text_channel:
@@ -286,6 +521,28 @@ class Music(commands.Cog):
         else:
             self.current.pop(gid, None)
 
+    async def wait_for_ffmpeg(self, gid, text_channel=None):
+        """Retry play_next once the host has a free FFmpeg slot, keeping the queue."""
+        if gid in self.ffmpeg_waits:
+            return
+        metrics.incr("ffmpeg.deferred")
+        if text_channel:
+            await text_channel.send(
+                "The bot is busy right now, your song will start as soon as possible."
+            )
+        self.ffmpeg_waits[gid] = self.bot.loop.create_task(self._retry_play(gid))
+
+    async def _retry_play(self, gid):
+        try:
+            while not supervisor.has_capacity(gid):
+                await asyncio.sleep(5)
+        finally:
+            self.ffmpeg_waits.pop(gid, None)
+        vc = discord.utils.get(self.bot.voice_clients, guild__id=gid)
+        if vc and not vc.is_playing() and not vc.is_paused():
+            # from_back so loop mode does not queue the current song again
+            await self.play_next(gid, from_back=True)
+
     # --- Command Checks ---
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         """Check if the user is in the same voice channel as the bot."""
@@ -294,7 +551,7 @@ class Music(commands.Cog):
             return True  # Allow commands if bot is not in a channel
 
         # Allow /play even if not in the same channel, as it can be used to summon the bot
-        if interaction.command.name in ("play", "playnext"):
+        if interaction.command.name in ("play", "playnext", "loadplaylist"):
             return True
 
         if interaction.user.voice and interaction.user.voice.channel == vc.channel:
@@ -309,48 +566,50 @@ class Music(commands.Cog):
     # --- Events ---
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        """Handle the bot leaving an empty voice channel."""
+        """Pause when the bot is left alone in voice and resume when someone returns."""
         # Ignore the bot's own voice state updates or if the user is just muting/deafening
         if member.id == self.bot.user.id or before.channel == after.channel:
             return
 
         vc = discord.utils.get(self.bot.voice_clients, guild=member.guild)
 
-        # If the bot is not in a voice channel, or the event is not for the bot's channel, ignore it
-        if not vc or not vc.channel or before.channel != vc.channel:
+        # If the bot is not in a voice channel, ignore it
+        if not vc or not vc.channel:
+            return
+
+        gid = member.guild.id
+        text_channel = self.text_channels.get(gid)
+
+        # Someone joined the bot's channel
+        if after.channel == vc.channel:
+            # Keep a paused session alive; a finished queue still times out
+            if vc.is_playing() or vc.is_paused():
+                self.cancel_idle(gid)
+            if gid in self.auto_paused:
+                self.auto_paused.discard(gid)
+                if vc.is_paused():
+                    vc.resume()
+                if text_channel:
+                    await text_channel.send("Welcome back, resuming playback.")
+            return
+
+        # Only care about members leaving the bot's channel
+        if before.channel != vc.channel:
             return
 
         # Check if the bot is now the only member in the channel
         if len(vc.channel.members) == 1 and vc.channel.members[0] == self.bot.user:
-            gid = member.guild.id
-            text_channel = self.text_channels.get(gid)
+            if vc.is_playing():
+                vc.pause()
+                self.auto_paused.add(gid)
 
             if text_channel:
                 await text_channel.send(
-                    "Leaving because there is no one in the voice channel."
+                    "No one is in the voice channel, pausing. "
+                    f"I'll leave in {self.format_time(self.idle_timeout)} if nobody returns."
                 )
 
-            self.get_queue(gid).clear()
-
-            if vc.is_playing() or vc.is_paused():
-                vc.stop()
-
-            await vc.disconnect()
-
-            # Clean up all associated data for the guild
-            for d in [
-                self.queues,
-                self.current,
-                self.history,
-                self.loop_states,
-                self.volumes,
-                self.filters,
-                self.autoplay_states,
-                self.start_times,
-                self.text_channels,
-                self.locks,  # Also clear the lock
-            ]:
-                d.pop(gid, None)
+            self.start_idle(gid)
 
     # --- Playback Commands ---
     @app_commands.command(name="play", description="Play music from search or link")
@@ -362,7 +621,10 @@ class Music(commands.Cog):
         is_spotify = "open.spotify.com" in query
         if is_spotify:
             try:
-                tracks = self.spotify_helper.extract_tracks(query)
+                # Spotify's client is synchronous, keep it off the event loop
+                tracks = await self.bot.loop.run_in_executor(
+                    None, self.spotify_helper.extract_tracks, query
+                )
                 if not tracks:
                     await inter.followup.send(
                         "Could not extract tracks from Spotify link."
@@ -373,7 +635,8 @@ class Music(commands.Cog):
                 print(f"Spotify extraction error: {e}")
                 return
         else:
-            tracks = [query]
+            # Autocomplete suggestions are URLs of tracks we already resolved
+            tracks = [self.track_index.lookup(query) or query]
 
         # Acquire the lock for this guild to prevent race conditions
         lock = self.get_lock(inter.guild.id)
@@ -381,18 +644,8 @@ class Music(commands.Cog):
             q = self.get_queue(inter.guild.id)
             q.extend(tracks)
 
-            vc = inter.guild.voice_client
-            if not vc:
-                vc = await self.join_vc(inter)
-                if not vc:
-                    return
-
-            # Store the channel where the command was initiated
-            self.text_channels[inter.guild.id] = inter.channel
-
-            # If the bot isn't already playing, start the player.
-            if not vc.is_playing() and not vc.is_paused():
-                await self.play_next(inter.guild.id, inter.channel)
+            if not await self.ensure_playing(inter):
+                return
 
         if is_spotify:
             await inter.followup.send(
@@ -400,7 +653,7 @@ class Music(commands.Cog):
             )
         else:
             await inter.followup.send(
-                f"Added to queue: `{query}`. Autoplay is {'on' if self.get_autoplay(inter.guild.id) else 'off'}."
+                f"Added to queue: `{tracks[0]}`. Autoplay is {'on' if self.get_autoplay(inter.guild.id) else 'off'}."
             )
 
     @app_commands.command(
@@ -414,7 +667,10 @@ class Music(commands.Cog):
         is_spotify = "open.spotify.com" in query
         if is_spotify:
             try:
-                tracks = self.spotify_helper.extract_tracks(query)
+                # Spotify's client is synchronous, keep it off the event loop
+                tracks = await self.bot.loop.run_in_executor(
+                    None, self.spotify_helper.extract_tracks, query
+                )
                 if not tracks:
                     await inter.followup.send(
                         "Could not extract tracks from Spotify link."
@@ -425,7 +681,8 @@ class Music(commands.Cog):
                 print(f"Spotify extraction error: {e}")
                 return
         else:
-            tracks = [query]
+            # Autocomplete suggestions are URLs of tracks we already resolved
+            tracks = [self.track_index.lookup(query) or query]
 
         # Acquire the lock for this guild to prevent race conditions
         lock = self.get_lock(inter.guild.id)
@@ -433,18 +690,8 @@ class Music(commands.Cog):
             q = self.get_queue(inter.guild.id)
             q[:0] = tracks
 
-            vc = inter.guild.voice_client
-            if not vc:
-                vc = await self.join_vc(inter)
-                if not vc:
-                    return
-
-            # Store the channel where the command was initiated
-            self.text_channels[inter.guild.id] = inter.channel
-
-            # If the bot isn't already playing, start the player.
-            if not vc.is_playing() and not vc.is_paused():
-                await self.play_next(inter.guild.id, inter.channel)
+            if not await self.ensure_playing(inter):
+                return
 
         if is_spotify:
             await inter.followup.send(
@@ -452,9 +699,20 @@ class Music(commands.Cog):
             )
         else:
             await inter.followup.send(
-                f"Added to front of queue: `{query}`. Autoplay is {'on' if self.get_autoplay(inter.guild.id) else 'off'}."
+                f"Added to front of queue: `{tracks[0]}`. Autoplay is {'on' if self.get_autoplay(inter.guild.id) else 'off'}."
             )
 
+    @play.autocomplete("query")
+    @playnext.autocomplete("query")
+    async def query_autocomplete(self, inter, current: str):
+        """Suggest already resolved tracks from the local index, without network calls."""
+        tracks = self.track_index.search(current, inter.guild_id)
+        return [
+            app_commands.Choice(name=t.title[:100], value=t.url)
+            for t in tracks
+            if len(t.url) <= 100
+        ]
+
     @app_commands.command(name="skip", description="Skip current song")
     async def skip(self, inter):
         vc = inter.guild.voice_client
@@ -464,7 +722,7 @@ class Music(commands.Cog):
         else:
             await inter.response.send_message("Nothing is playing.")
 
-    @app_commands.command(name="stop", description="Stop music and leave voice channel")
+    @app_commands.command(name="stop", description="Stop music and clear the queue")
     async def stop(self, inter):
         gid = inter.guild.id
         self.set_autoplay(gid, False)
@@ -472,23 +730,13 @@ class Music(commands.Cog):
         if vc:
             self.get_queue(gid).clear()
             vc.stop()
-            await vc.disconnect()
+            # Keep the connection warm so the next /play skips the voice handshake
+            self.auto_paused.discard(gid)
+            self.start_idle(gid)
         # Clean up all associated data for the guild
-        for d in [
-            self.queues,
-            self.current,
-            self.history,
-            self.loop_states,
-            self.volumes,
-            self.filters,
-            self.autoplay_states,
-            self.start_times,
-            self.text_channels,
-            self.locks,
-        ]:
-            d.pop(gid, None)
+        self.cleanup_guild(gid)
         await inter.response.send_message(
-            "Music stopped in the server, see you next time."
+            "Music stopped and the queue was cleared."
         )
 
     @app_commands.command(name="pause", description="Pause or resume playback (toggle)")
@@ -537,7 +785,7 @@ class Music(commands.Cog):
             return
         em = discord.Embed(title="Queue")
         if cur:
-            dur = int(cur.data.get("duration", 0))
+            dur = cur.info.duration
             start = self.start_times.get(inter.guild.id)
             if start:
                 speed = self.get_speed(inter.guild.id)
@@ -549,7 +797,7 @@ class Music(commands.Cog):
             dur_str = self.format_time(dur)
             em.add_field(
                 name="Now",
-                value=f"[{cur.title}]({cur.data.get('webpage_url', '')}) [{pos_str}/{dur_str}]",
+                value=f"[{cur.title}]({cur.info.webpage_url}) [{pos_str}/{dur_str}]",
                 inline=False,
             )
         if q:
@@ -566,7 +814,7 @@ class Music(commands.Cog):
     async def nowplaying(self, inter):
         cur = self.current.get(inter.guild.id)
         if cur:
-            dur = int(cur.data.get("duration", 0))
+            dur = cur.info.duration
             start = self.start_times.get(inter.guild.id)
             if start:
                 speed = self.get_speed(inter.guild.id)
@@ -621,6 +869,104 @@ class Music(commands.Cog):
         q[a - 1], q[b - 1] = q[b - 1], q[a - 1]
         await inter.response.send_message(f"Swapped positions {a} and {b}.")
 
+    # --- Saved Playlists ---
+    async def _resolve_for_saving(self, gid, query):
+        """Turn a queue entry into a SavedTrack, resolving plain queries cheaply."""
+        if isinstance(query, Replay):
+            query = query.entry
+        if isinstance(query, SavedTrack):
+            return query
+        cur = self.current.get(gid)
+        if cur and cur.query == query:
+            return cur.info.to_saved_track()
+        try:
+            async with self.resolve_concurrency:
+                entry = await self.bot.loop.run_in_executor(
+                    None, lambda: extract_flat(query)
+                )
+        except Exception as e:
+            print(f"Error resolving {query} for saving: {e}")
+            return None
+        return SavedTrack.from_info(entry) if entry else None
+
+    @app_commands.command(
+        name="saveplaylist", description="Save the current song and queue as a playlist"
+    )
+    @app_commands.describe(name="Playlist name")
+    async def saveplaylist(self, inter, name: str):
+        gid = inter.guild.id
+        cur = self.current.get(gid)
+        entries = ([cur.query] if cur else []) + list(self.get_queue(gid))
+        if not entries:
+            return await inter.response.send_message("Nothing to save.")
+        await inter.response.defer(thinking=True)
+
+        dropped = max(0, len(entries) - self.max_playlist_tracks)
+        entries = entries[: self.max_playlist_tracks]
+
+        # Resolve in parallel (bounded by resolve_concurrency), and give up
+        # well before Discord's 15 minute followup window closes
+        tasks = [
+            asyncio.ensure_future(self._resolve_for_saving(gid, q)) for q in entries
+        ]
+        _, pending = await asyncio.wait(tasks, timeout=600)
+        for task in pending:
+            task.cancel()
+        tracks = [
+            t.result() for t in tasks if t not in pending and not t.cancelled() and t.result()
+        ]
+        if not tracks:
+            return await inter.followup.send("Could not resolve any songs to save.")
+
+        self.library.save_playlist(gid, name, tracks)
+        skipped = len(entries) - len(tracks)
+        msg = f"Saved playlist **{name}** with {len(tracks)} songs."
+        if skipped:
+            msg += f" Skipped {skipped} that could not be resolved."
+        if dropped:
+            msg += f" Left out the last {dropped} songs (limit is {self.max_playlist_tracks})."
+        await inter.followup.send(msg)
+
+    @app_commands.command(
+        name="loadplaylist", description="Add a saved playlist to the queue"
+    )
+    @app_commands.describe(name="Playlist name")
+    async def loadplaylist(self, inter, name: str):
+        tracks = self.library.load_playlist(inter.guild.id, name)
+        if tracks is None:
+            return await inter.response.send_message(f"No playlist named **{name}**.")
+        await inter.response.defer(thinking=True)
+
+        lock = self.get_lock(inter.guild.id)
+        async with lock:
+            self.get_queue(inter.guild.id).extend(tracks)
+
+            if not await self.ensure_playing(inter):
+                return
+
+        await inter.followup.send(
+            f"Added {len(tracks)} tracks from playlist **{name}** to the queue."
+        )
+
+    @app_commands.command(name="playlists", description="List saved playlists")
+    async def playlists(self, inter):
+        rows = self.library.list_playlists(inter.guild.id)
+        if not rows:
+            return await inter.response.send_message("No saved playlists.")
+        em = discord.Embed(title="Saved Playlists")
+        em.description = "\n".join(f"**{n}** ({c} songs)" for n, c in rows[:25])
+        if len(rows) > 25:
+            em.set_footer(text=f"...and {len(rows)-25} more")
+        await inter.response.send_message(embed=em)
+
+    @app_commands.command(name="deleteplaylist", description="Delete a saved playlist")
+    @app_commands.describe(name="Playlist name")
+    async def deleteplaylist(self, inter, name: str):
+        if self.library.delete_playlist(inter.guild.id, name):
+            await inter.response.send_message(f"Deleted playlist **{name}**.")
+        else:
+            await inter.response.send_message(f"No playlist named **{name}**.")
+
     # --- Audio Settings and Effects ---
     @app_commands.command(name="loop", description="Toggle loop mode")
     async def loop(self, inter):
@@ -633,8 +979,19 @@ class Music(commands.Cog):
     @app_commands.command(name="volume", description="Set playback volume (max 200%)")
     @app_commands.describe(level="Volume level (0-200)")
     async def volume(self, inter, level: int):
+        gid = inter.guild.id
         capped = max(0, min(level, 200))
-        self.set_vol(inter.guild.id, capped / 100)
+        self.set_vol(gid, capped / 100)
+        vc = inter.guild.voice_client
+        cur = self.current.get(gid)
+        if vc and cur and vc.source and vc.source.is_opus() and capped != 100:
+            # A passthrough stream cannot change volume; reload it on the PCM path
+            self.get_queue(gid).insert(0, Replay(cur.query))
+            vc.stop()
+            await inter.response.send_message(
+                f"Volume set to **{capped}%**. Reloading current song..."
+            )
+            return
         await inter.response.send_message(f"Volume set to **{capped}%**")
 
     @app_commands.command(name="seek", description="Seek in current song")
@@ -645,7 +1002,7 @@ class Music(commands.Cog):
         if not vc or not cur:
             return await inter.response.send_message("Nothing playing.")
 
-        self.get_queue(inter.guild.id).insert(0, cur.query)
+        self.get_queue(inter.guild.id).insert(0, Replay(cur.query))
 
         # This is a simple reload-based seek. True seeking is more complex.
         vc.stop()
@@ -661,17 +1018,18 @@ class Music(commands.Cog):
             return
         await inter.response.defer(thinking=True)
         self.set_speed(inter.guild.id, rate)
-        self.get_queue(inter.guild.id).insert(0, cur.query)
+        self.get_queue(inter.guild.id).insert(0, Replay(cur.query))
         vc.stop()
         await inter.followup.send(f"Playback speed set to {rate}x (reloading...)")
 
-    @app_commands.command(name="filter", description="Apply an audio filter")
+    @app_commands.command(name="filter", description="Toggle an audio filter")
     @app_commands.describe(
-        filter_name="The audio filter to apply. Choose 'none' to disable."
+        filter_name="The audio filter to add or remove. Choose 'none' to clear all."
     )
     @app_commands.choices(
         filter_name=[
-            app_commands.Choice(name=key, value=key) for key in AUDIO_FILTERS.keys()
+            app_commands.Choice(name=key, value=key)
+            for key in ["none", *EFFECTS.keys()]
         ]
     )
     async def filter(self, inter, filter_name: str):
@@ -679,17 +1037,18 @@ class Music(commands.Cog):
         vc = inter.guild.voice_client
         cur = self.current.get(gid)
 
-        self.set_filter(gid, filter_name)
+        active = self.toggle_filter(gid, filter_name)
+        active_str = ", ".join(active) or "none"
 
         if vc and cur:
             await inter.response.defer(thinking=True)
-            self.get_queue(gid).insert(0, cur.query)
+            self.get_queue(gid).insert(0, Replay(cur.query))
             vc.stop()
             await inter.followup.send(
-                f"Filter set to **{filter_name}**. Reloading current song..."
+                f"Active filters: **{active_str}**. Reloading current song..."
             )
         else:
-            await inter.response.send_message(f"Filter set to **{filter_name}**.")
+            await inter.response.send_message(f"Active filters: **{active_str}**.")
 
     @app_commands.command(name="autoplay", description="Toggle autoplay mode")
     async def autoplay(self, inter):
@@ -701,6 +1060,90 @@ class Music(commands.Cog):
             f"Autoplay is now **{'on' if new_state else 'off'}**."
         )
 
+    # --- Background Tasks ---
+    @tasks.loop(seconds=10)
+    async def supervise_ffmpeg(self):
+        """Sample FFmpeg resource usage and reap orphaned or stuck processes."""
+        attached, playing = set(), set()
+        for vc in self.bot.voice_clients:
+            if not vc.source:
+                continue
+            source = getattr(vc.source, "original", vc.source)
+            attached.add(source)
+            if vc.is_playing():
+                playing.add(source)
+        supervisor.sample(attached, playing)
+
+    def apply_bitrate(self, vc):
+        """Set the voice encoder to the governor's current bitrate."""
+        encoder = getattr(vc, "encoder", None)
+        if encoder and vc.source and not vc.source.is_opus():
+            encoder.set_bitrate(governor.bitrate)
+
+    @tasks.loop(seconds=5)
+    async def govern_load(self):
+        """Step playback quality down or up depending on host load."""
+        if governor.evaluate():
+            # Bitrate is the one setting running streams can change right away
+            for vc in self.bot.voice_clients:
+                self.apply_bitrate(vc)
+
+    # --- Diagnostics ---
+    @app_commands.command(name="stats", description="Show bot performance metrics")
+    async def stats(self, inter):
+        snap = metrics.snapshot()
+        em = discord.Embed(title="Stats")
+        em.add_field(
+            name="Voice Connections",
+            value=f"{len(self.bot.voice_clients)} active, {len(self.idle_tasks)} idle",
+            inline=False,
+        )
+        complete = True
+        for section in ("counters", "gauges"):
+            complete &= self._add_lines_field(
+                em,
+                section.capitalize(),
+                [
+                    f"{k}: {v:g}" if isinstance(v, float) else f"{k}: {v}"
+                    for k, v in sorted(snap[section].items())
+                ],
+            )
+        complete &= self._add_lines_field(
+            em,
+            "Distributions (p50 / p95 / p99)",
+            [
+                f"{k}: " + " / ".join(f"{v:.1f}" for v in pcts.values())
+                for k, pcts in sorted(snap["distributions"].items())
+            ],
+        )
+        if not complete:
+            em.set_footer(text="Some metrics did not fit and were left out.")
+        await inter.response.send_message(embed=em)
+
+    def _add_lines_field(self, em, name, lines):
+        """
+        Add lines to an embed, split across fields within Discord's limits
+        (1024 chars per field, 25 fields, 6000 chars in total).
+        Returns False if some lines did not fit.
+        """
+        chunks, chunk = [], ""
+        for line in lines:
+            line = line[:1024]
+            if chunk and len(chunk) + len(line) + 1 > 1024:
+                chunks.append(chunk)
+                chunk = ""
+            chunk = f"{chunk}\n{line}" if chunk else line
+        if chunk:
+            chunks.append(chunk)
+
+        for i, value in enumerate(chunks):
+            field_name = name if i == 0 else f"{name} (cont.)"
+            # Leave room for the footer
+            if len(em.fields) >= 25 or len(em) + len(field_name) + len(value) > 5900:
+                return False
+            em.add_field(name=field_name, value=value, inline=False)
+        return True
+
 
 async def setup(bot):
     with open("config.json") as f:
@@ -708,4 +1151,14 @@ async def setup(bot):
     spotify_helper = SpotifyHelper(
         client_id=cfg["spotify_client_id"], client_secret=cfg["spotify_client_secret"]
     )
-    await bot.add_cog(Music(bot, spotify_helper))
+    supervisor.max_processes = cfg.get("max_ffmpeg_processes", 32)
+    supervisor.max_per_guild = cfg.get("max_ffmpeg_per_guild", 2)
+    library = Library(cfg.get("library_path", "library.db"))
+    await bot.add_cog(
+        Music(
+            bot,
+            spotify_helper,
+            library,
+            normalize=cfg.get("normalize_loudness", True),
+        )
+    )
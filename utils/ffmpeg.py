@@ -0,0 +1,179 @@
+import os
+import subprocess
+import threading
+import time
+import weakref
+
+import discord
+
+from utils.metrics import metrics
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class ProcessLimitError(RuntimeError):
+    """Raised when spawning another FFmpeg process would exceed the global cap."""
+
+
+class _Child:
+    __slots__ = ("proc", "gid", "owner", "started", "cpu", "progressed", "killed")
+
+    def __init__(self, proc, gid, owner):
+        self.proc = proc
+        self.gid = gid
+        self.owner = weakref.ref(owner) if owner is not None else None
+        self.started = time.monotonic()
+        self.cpu = 0.0  # CPU seconds used so far
+        self.progressed = self.started  # Last time the CPU time went up
+        self.killed = False
+
+
+def _read_usage(pid):
+    """Return (cpu seconds, rss bytes) of a process from /proc, or None."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces, so split after its closing paren
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    cpu = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    return cpu, rss_pages * _PAGE_SIZE
+
+
+class FFmpegSupervisor:
+    """
+    Owns every FFmpeg child the player spawns. It enforces a global and a
+    per-guild process cap, samples CPU and RSS into metrics, and kills
+    processes that are orphaned or stopped making progress.
+    """
+
+    def __init__(self, max_processes=32, max_per_guild=2, orphan_grace=15, stall_timeout=30):
+        self.max_processes = max_processes
+        self.max_per_guild = max_per_guild
+        self.orphan_grace = orphan_grace
+        self.stall_timeout = stall_timeout
+        self._children = {}  # pid -> _Child
+        # Processes are released from the audio player thread
+        self._lock = threading.Lock()
+
+    def has_capacity(self, gid=None):
+        """Whether a new process for `gid` would fit under the global cap."""
+        with self._lock:
+            live = [c for c in self._children.values() if not c.killed]
+        # Spawning for a guild at its own cap replaces that guild's oldest process
+        own = sum(1 for c in live if gid is not None and c.gid == gid)
+        reclaimable = max(0, own - self.max_per_guild + 1)
+        return len(live) - reclaimable < self.max_processes
+
+    def spawn(self, gid, args, owner=None, **kwargs):
+        """Start an FFmpeg process for a guild, making room under the caps first."""
+        with self._lock:
+            if gid is not None:
+                own = sorted(
+                    (c for c in self._children.values() if c.gid == gid and not c.killed),
+                    key=lambda c: c.started,
+                )
+                # Reloads replace the guild's stream, so the oldest ones are stale
+                while len(own) >= self.max_per_guild:
+                    self._kill(own.pop(0), "guild_cap")
+            live = sum(1 for c in self._children.values() if not c.killed)
+            if live >= self.max_processes:
+                metrics.incr("ffmpeg.rejected")
+                raise ProcessLimitError(f"{live} FFmpeg processes already running")
+
+            proc = subprocess.Popen(args, **kwargs)
+            self._children[proc.pid] = _Child(proc, gid, owner)
+            metrics.incr("ffmpeg.spawned")
+            metrics.gauge("ffmpeg.processes", live + 1)
+        return proc
+
+    def release(self, proc):
+        """Forget a process that its owner has cleaned up."""
+        with self._lock:
+            self._children.pop(proc.pid, None)
+            metrics.gauge("ffmpeg.processes", len(self._children))
+
+    def _kill(self, child, reason):
+        child.killed = True
+        metrics.incr(f"ffmpeg.killed.{reason}")
+        try:
+            child.proc.kill()
+        except ProcessLookupError:
+            pass
+
+    def sample(self, attached=(), playing=()):
+        """
+        Record resource usage of every child and reap the bad ones.
+        `attached` holds the sources currently set on a voice client and
+        `playing` the subset that is not paused.
+        """
+        now = time.monotonic()
+        with self._lock:
+            children = list(self._children.values())
+        for child in children:
+            if child.proc.poll() is not None:
+                # Exited (or killed by us); reap it so it does not linger as a zombie
+                with self._lock:
+                    self._children.pop(child.proc.pid, None)
+                continue
+            if child.killed:
+                continue
+
+            usage = _read_usage(child.proc.pid)
+            if usage:
+                cpu, rss = usage
+                elapsed = now - max(child.progressed, child.started)
+                if cpu > child.cpu:
+                    if elapsed > 0:
+                        metrics.observe("ffmpeg.cpu_pct", (cpu - child.cpu) / elapsed * 100)
+                    child.cpu = cpu
+                    child.progressed = now
+                metrics.observe("ffmpeg.rss_mb", rss / 2**20)
+
+            if child.owner is None:
+                # Background jobs (loudness analysis) enforce their own timeouts
+                continue
+            owner = child.owner()
+            if owner not in attached:
+                if now - child.started > self.orphan_grace:
+                    self._kill(child, "orphan")
+            elif owner in playing and now - child.progressed > self.stall_timeout:
+                self._kill(child, "stalled")
+
+        with self._lock:
+            metrics.gauge(
+                "ffmpeg.processes",
+                sum(1 for c in self._children.values() if not c.killed),
+            )
+
+
+# Shared supervisor for all FFmpeg processes
+supervisor = FFmpegSupervisor()
+
+
+class _Supervised:
+    """Mixin that spawns an FFmpegAudio's process through the supervisor."""
+
+    def __init__(self, source, *, gid=None, **kwargs):
+        self._gid = gid
+        super().__init__(source, **kwargs)
+
+    def _spawn_process(self, args, **subprocess_kwargs):
+        return supervisor.spawn(self._gid, args, owner=self, **subprocess_kwargs)
+
+    def cleanup(self):
+        proc = getattr(self, "_process", None)
+        super().cleanup()
+        if proc:
+            supervisor.release(proc)
+
+
+class SupervisedFFmpegPCMAudio(_Supervised, discord.FFmpegPCMAudio):
+    """An FFmpegPCMAudio whose process is spawned through the supervisor."""
+
+
+class SupervisedFFmpegOpusAudio(_Supervised, discord.FFmpegOpusAudio):
+    """An FFmpegOpusAudio whose process is spawned through the supervisor."""
@@ -0,0 +1,63 @@
+import functools
+
+# Discord voice always runs at 48 kHz, so every graph is built around it
+SAMPLE_RATE = 48000
+
+# Audio effects users can stack. An effect may change the playback rate
+# (speed and pitch together), the tempo (speed only) and add plain filters.
+# Expensive effects are the first to go when the host is overloaded.
+EFFECTS = {
+    "bassboost": {"filters": ("bass=g=10",)},
+    "nightcore": {"rate": 1.25, "tempo": 1.06, "expensive": True},
+    "vaporwave": {"rate": 0.8, "tempo": 0.8, "expensive": True},
+    "8d": {"filters": ("apulsator=hz=0.08",), "expensive": True},
+    "vibrato": {"filters": ("vibrato=f=6.5",), "expensive": True},
+    "tremolo": {"filters": ("tremolo",)},
+    "earrape": {"filters": ("acrusher=1:1:64:0:log",)},
+}
+
+
+def _atempo_chain(tempo):
+    """Split a tempo factor into atempo stages within its 0.5-2.0 range."""
+    stages = []
+    while tempo > 2.0:
+        stages.append("atempo=2.0")
+        tempo /= 2.0
+    while tempo < 0.5:
+        stages.append("atempo=0.5")
+        tempo /= 0.5
+    if abs(tempo - 1.0) > 1e-6:
+        stages.append(f"atempo={tempo:.6g}")
+    return stages
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(effects, speed):
+    rate = 1.0
+    tempo = speed
+    filters = []
+    for name in effects:
+        effect = EFFECTS[name]
+        rate *= effect.get("rate", 1.0)
+        tempo *= effect.get("tempo", 1.0)
+        filters.extend(effect.get("filters", ()))
+
+    graph = []
+    if abs(rate - 1.0) > 1e-6:
+        # Pin the input to 48 kHz so the rate change is exact; FFmpeg's own
+        # output conversion then does the single resample back to 48 kHz.
+        graph.append(f"aresample={SAMPLE_RATE}")
+        graph.append(f"asetrate={round(SAMPLE_RATE * rate)}")
+    graph.extend(_atempo_chain(tempo))
+    graph.extend(filters)
+    return ",".join(graph) or None
+
+
+def compile_filters(effects=(), speed=1.0):
+    """
+    Compile a stack of effects and a playback speed into one FFmpeg -af graph.
+    Rate and tempo changes from all effects are merged into a single resample
+    and a minimal atempo chain. Returns None when no filtering is needed.
+    """
+    names = tuple(dict.fromkeys(e for e in effects if e in EFFECTS))
+    return _compile(names, float(speed))
@@ -0,0 +1,151 @@
+import os
+import time
+
+from utils.filters import EFFECTS
+from utils.metrics import metrics
+
+# Discord expects one 20 ms Opus frame per send
+FRAME_INTERVAL = 0.02
+
+# Degradation levels, from full quality to cheapest
+LEVELS = ("full", "no_effects", "passthrough", "low_bitrate")
+
+DEFAULT_BITRATE = 128
+LOW_BITRATE = 64
+
+
+def _read_cpu_times():
+    """Return (busy, total) jiffies of the host from /proc/stat, or None."""
+    try:
+        with open("/proc/stat") as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    return sum(values) - idle, sum(values)
+
+
+class LoadGovernor:
+    """
+    Watches the voice send loop for late frames and the host's CPU usage,
+    and steps playback quality down under pressure and back up once load
+    recovers. Bitrate changes apply to running streams at once; effects and
+    passthrough are picked up by new tracks, so after stepping down the
+    governor waits `min_dwell` seconds before it steps down again.
+    """
+
+    def __init__(
+        self,
+        late_high=0.05,
+        late_low=0.01,
+        cpu_high=0.9,
+        cpu_low=0.6,
+        recover_after=3,
+        tolerance=0.01,
+        min_dwell=60,
+    ):
+        self.late_high = late_high
+        self.late_low = late_low
+        self.cpu_high = cpu_high
+        self.cpu_low = cpu_low
+        self.recover_after = recover_after
+        self.tolerance = tolerance
+        self.min_dwell = min_dwell
+        self.level = 0
+        self._changed_at = time.monotonic()
+        self._frames = 0
+        self._late = 0
+        self._calm = 0
+        self._cpu = _read_cpu_times()
+
+    @property
+    def drop_effects(self):
+        return self.level >= LEVELS.index("no_effects")
+
+    @property
+    def passthrough(self):
+        return self.level >= LEVELS.index("passthrough")
+
+    @property
+    def bitrate(self):
+        if self.level >= LEVELS.index("low_bitrate"):
+            return LOW_BITRATE
+        return DEFAULT_BITRATE
+
+    def frame(self, interval):
+        """Record the time between two reads of the audio player thread."""
+        if interval > 1.0:
+            # Paused or just resumed, not a late frame
+            return
+        self._frames += 1
+        if interval > FRAME_INTERVAL + self.tolerance:
+            self._late += 1
+
+    def effects(self, effects):
+        """Return the effects that may run at the current level."""
+        if not self.drop_effects:
+            return effects
+        return tuple(e for e in effects if not EFFECTS[e].get("expensive"))
+
+    def host_cpu(self):
+        """Fraction of host CPU busy since the last call."""
+        times = _read_cpu_times()
+        if times and self._cpu:
+            busy = times[0] - self._cpu[0]
+            total = times[1] - self._cpu[1]
+            self._cpu = times
+            return busy / total if total else 0.0
+        self._cpu = times
+        if hasattr(os, "getloadavg"):
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        return 0.0
+
+    def evaluate(self):
+        """
+        Update the degradation level from the samples since the last call.
+        Returns True if the level changed.
+        """
+        old_level = self.level
+        frames, late = self._frames, self._late
+        self._frames = self._late = 0
+        late_ratio = late / frames if frames else 0.0
+        cpu = self.host_cpu()
+        metrics.observe("governor.late_pct", late_ratio * 100)
+        metrics.observe("governor.cpu_pct", cpu * 100)
+
+        if late_ratio > self.late_high or cpu > self.cpu_high:
+            self._calm = 0
+            settled = time.monotonic() - self._changed_at >= self.min_dwell
+            if self.level < len(LEVELS) - 1 and (self.level == 0 or settled):
+                self._step(+1, late_ratio, cpu)
+        elif late_ratio < self.late_low and cpu < self.cpu_low:
+            self._calm += 1
+            if self.level > 0 and self._calm >= self.recover_after:
+                self._calm = 0
+                self._step(-1, late_ratio, cpu)
+        else:
+            self._calm = 0
+        metrics.gauge("governor.level", self.level)
+        return self.level != old_level
+
+    def _step(self, direction, late_ratio, cpu):
+        old = LEVELS[self.level]
+        self.level += direction
+        self._changed_at = time.monotonic()
+        metrics.incr("governor.step_down" if direction > 0 else "governor.step_up")
+        metrics.incr(f"governor.enter.{LEVELS[self.level]}")
+        print(
+            f"Load governor: {old} -> {LEVELS[self.level]} "
+            f"(late frames {late_ratio:.1%}, cpu {cpu:.0%})"
+        )
+
+    def time_frame(self, last_read):
+        """Helper for sources: record a frame and return the new read time."""
+        now = time.perf_counter()
+        if last_read is not None:
+            self.frame(now - last_read)
+        return now
+
+
+# Shared governor for all voice connections
+governor = LoadGovernor()
@@ -0,0 +1,158 @@
+import sqlite3
+import time
+
+
+class SavedTrack:
+    """A queue entry that was already resolved to a concrete video."""
+
+    __slots__ = ("video_id", "url", "title", "duration", "loudness", "peak")
+
+    def __init__(self, video_id, url, title, duration=0, loudness=None, peak=None):
+        self.video_id = video_id
+        self.url = url
+        self.title = title
+        self.duration = duration or 0
+        self.loudness = loudness
+        self.peak = peak
+
+    def __str__(self):
+        return self.title
+
+    def __repr__(self):
+        return f"SavedTrack({self.video_id!r}, {self.title!r})"
+
+    @classmethod
+    def from_info(cls, info):
+        """Build a SavedTrack from a yt-dlp info dict or flat entry."""
+        video_id = info.get("id")
+        url = info.get("webpage_url") or info.get("url")
+        if not video_id or not url:
+            return None
+        return cls(video_id, url, info.get("title") or url, info.get("duration"))
+
+
+class Library:
+    """A small SQLite store for per-guild saved playlists and track metadata."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tracks (
+                video_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                duration INTEGER NOT NULL DEFAULT 0,
+                loudness REAL,
+                peak REAL
+            );
+            CREATE TABLE IF NOT EXISTS playlists (
+                id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (guild_id, name)
+            );
+            CREATE TABLE IF NOT EXISTS playlist_tracks (
+                playlist_id INTEGER NOT NULL
+                    REFERENCES playlists (id) ON DELETE CASCADE,
+                position INTEGER NOT NULL,
+                video_id TEXT NOT NULL REFERENCES tracks (video_id),
+                PRIMARY KEY (playlist_id, position)
+            );
+            """
+        )
+        # Databases created before loudness analysis existed lack the columns
+        columns = [r[1] for r in self.db.execute("PRAGMA table_info(tracks)")]
+        for column in ("loudness", "peak"):
+            if column not in columns:
+                self.db.execute(f"ALTER TABLE tracks ADD COLUMN {column} REAL")
+        self.db.commit()
+
+    def remember_track(self, track):
+        """Cache a track's metadata, keeping any loudness already measured."""
+        with self.db:
+            self._upsert_tracks([track])
+
+    def _upsert_tracks(self, tracks):
+        self.db.executemany(
+            "INSERT INTO tracks (video_id, url, title, duration) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (video_id) DO UPDATE SET url = excluded.url, "
+            "title = excluded.title, duration = excluded.duration",
+            [(t.video_id, t.url, t.title, int(t.duration)) for t in tracks],
+        )
+
+    def get_loudness(self, video_id):
+        """Return (integrated loudness LUFS, true peak dBFS) of a track, or None."""
+        row = self.db.execute(
+            "SELECT loudness, peak FROM tracks WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        return row if row and row[0] is not None else None
+
+    def set_loudness(self, video_id, loudness, peak=None):
+        """Store the measured loudness (LUFS) and true peak (dBFS) of a cached track."""
+        with self.db:
+            self.db.execute(
+                "UPDATE tracks SET loudness = ?, peak = ? WHERE video_id = ?",
+                (loudness, peak, video_id),
+            )
+
+    def recent_tracks(self, limit):
+        """Return up to `limit` cached tracks, most recently added first."""
+        rows = self.db.execute(
+            "SELECT video_id, url, title, duration, loudness, peak FROM tracks "
+            "ORDER BY rowid DESC LIMIT ?",
+            (limit,),
+        )
+        return [SavedTrack(*r) for r in rows]
+
+    def save_playlist(self, gid, name, tracks):
+        """Save (or overwrite) a guild playlist from a list of SavedTracks."""
+        with self.db:
+            self._upsert_tracks(tracks)
+            self.db.execute(
+                "DELETE FROM playlists WHERE guild_id = ? AND name = ?", (gid, name)
+            )
+            cur = self.db.execute(
+                "INSERT INTO playlists (guild_id, name, created_at) VALUES (?, ?, ?)",
+                (gid, name, time.time()),
+            )
+            playlist_id = cur.lastrowid
+            self.db.executemany(
+                "INSERT INTO playlist_tracks (playlist_id, position, video_id) VALUES (?, ?, ?)",
+                [(playlist_id, i, t.video_id) for i, t in enumerate(tracks)],
+            )
+
+    def load_playlist(self, gid, name):
+        """Return the SavedTracks of a guild playlist, or None if it does not exist."""
+        row = self.db.execute(
+            "SELECT id FROM playlists WHERE guild_id = ? AND name = ?", (gid, name)
+        ).fetchone()
+        if row is None:
+            return None
+        rows = self.db.execute(
+            "SELECT t.video_id, t.url, t.title, t.duration, t.loudness, t.peak "
+            "FROM playlist_tracks p "
+            "JOIN tracks t ON t.video_id = p.video_id "
+            "WHERE p.playlist_id = ? ORDER BY p.position",
+            (row[0],),
+        )
+        return [SavedTrack(*r) for r in rows]
+
+    def list_playlists(self, gid):
+        """Return (name, track count) pairs for every playlist of a guild."""
+        return self.db.execute(
+            "SELECT p.name, COUNT(t.position) FROM playlists p "
+            "LEFT JOIN playlist_tracks t ON t.playlist_id = p.id "
+            "WHERE p.guild_id = ? GROUP BY p.id ORDER BY p.name",
+            (gid,),
+        ).fetchall()
+
+    def delete_playlist(self, gid, name):
+        """Delete a guild playlist. Returns True if it existed."""
+        with self.db:
+            cur = self.db.execute(
+                "DELETE FROM playlists WHERE guild_id = ? AND name = ?", (gid, name)
+            )
+        return cur.rowcount > 0
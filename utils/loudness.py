@@ -0,0 +1,126 @@
+import asyncio
+import re
+import subprocess
+
+from utils.ffmpeg import ProcessLimitError, supervisor
+from utils.metrics import metrics
+
+# Integrated loudness every track is normalized towards (streaming services use -14)
+TARGET_LUFS = -14.0
+# Never boost quiet tracks by more than +6 dB
+MAX_GAIN_DB = 6.0
+# Boosts stop where the track's true peak would pass this level (at 100% volume)
+PEAK_CEILING = -1.0
+
+_INTEGRATED_RE = re.compile(r"I:\s+(-?\d+(?:\.\d+)?) LUFS")
+_PEAK_RE = re.compile(r"Peak:\s+(-?\d+(?:\.\d+)?|-inf) dBFS")
+
+
+def gain_for(loudness, peak=None, target=TARGET_LUFS):
+    """
+    Linear gain that brings a track measured at `loudness` LUFS to `target`.
+    Boosts are limited by the headroom above the track's true `peak` (dBFS),
+    so quiet-mastered tracks are not pushed into clipping.
+    """
+    if loudness is None:
+        return 1.0
+    gain_db = min(target - loudness, MAX_GAIN_DB)
+    if gain_db > 0 and peak is not None:
+        gain_db = min(gain_db, max(0.0, PEAK_CEILING - peak))
+    return 10 ** (gain_db / 20)
+
+
+class LoudnessAnalyzer:
+    """Measures each track's integrated loudness once, in the background."""
+
+    def __init__(
+        self, library, concurrency=1, executable="ffmpeg", timeout=300, max_duration=3 * 3600
+    ):
+        self.library = library
+        self.executable = executable
+        self.timeout = timeout  # Seconds before an analysis pass is killed
+        self.max_duration = max_duration  # Longer tracks are never analysed
+        self._sem = asyncio.Semaphore(concurrency)
+        self._pending = {}
+
+    def schedule(self, video_id, url, duration, callback=None):
+        """Queue a measurement unless one for this track is already running."""
+        if video_id in self._pending:
+            return
+        if not duration or duration > self.max_duration:
+            # Livestreams (no duration) would never finish, long mixes take too long
+            metrics.incr("loudness.skipped")
+            return
+        task = asyncio.create_task(self._run(video_id, url, callback))
+        self._pending[video_id] = task
+        task.add_done_callback(lambda _: self._pending.pop(video_id, None))
+
+    async def _run(self, video_id, url, callback):
+        async with self._sem:
+            try:
+                result = await self.measure(url)
+            except ProcessLimitError:
+                # Playback has priority; the track is measured on a later play
+                metrics.incr("loudness.deferred")
+                return
+            except Exception as e:
+                print(f"Error measuring loudness of {video_id}: {e}")
+                return
+        if result is None:
+            return
+        loudness, peak = result
+        self.library.set_loudness(video_id, loudness, peak)
+        if callback:
+            callback(loudness, peak)
+
+    async def measure(self, url):
+        """
+        Run an ebur128 analysis pass over a stream and return its integrated
+        loudness (LUFS) and true peak (dBFS, None if silent), or None.
+        """
+        args = [
+            self.executable,
+            "-hide_banner",
+            "-nostats",
+            "-reconnect", "1",
+            "-reconnect_streamed", "1",
+            "-reconnect_delay_max", "5",
+            "-i", url,
+            "-vn",
+            "-af", "ebur128=framelog=quiet:peak=true",
+            "-f", "null",
+            "-",
+        ]
+        # Spawned through the supervisor so analysis counts against the caps
+        proc = supervisor.spawn(
+            None,
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.get_running_loop().run_in_executor(
+                None, self._communicate, proc
+            )
+        finally:
+            supervisor.release(proc)
+        if stderr is None:
+            return None
+        output = stderr.decode(errors="ignore")
+        matches = _INTEGRATED_RE.findall(output)
+        if proc.returncode != 0 or not matches:
+            return None
+        # The summary printed at the end holds the values for the whole track
+        peaks = _PEAK_RE.findall(output)
+        peak = float(peaks[-1]) if peaks and peaks[-1] != "-inf" else None
+        return float(matches[-1]), peak
+
+    def _communicate(self, proc):
+        try:
+            return proc.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            metrics.incr("loudness.timeouts")
+            return None, None
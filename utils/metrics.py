@@ -0,0 +1,49 @@
+import collections
+
+
+class Metrics:
+    """In-process counters, gauges and sampled distributions for /stats."""
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self.samples = {}
+
+    def incr(self, name, n=1):
+        """Increase a counter."""
+        self.counters[name] += n
+
+    def gauge(self, name, value):
+        """Set a gauge to its current value."""
+        self.gauges[name] = value
+
+    def observe(self, name, value):
+        """Record a sample; only the most recent `window` samples are kept."""
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = collections.deque(maxlen=self.window)
+        samples.append(value)
+
+    def percentile(self, name, pct):
+        """Return the given percentile (0-100) of a distribution, or None."""
+        samples = sorted(self.samples.get(name, ()))
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(len(samples) * pct / 100))
+        return samples[idx]
+
+    def snapshot(self):
+        """Return a plain dict of every metric, with p50/p95/p99 for distributions."""
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "distributions": {
+                name: {p: self.percentile(name, p) for p in (50, 95, 99)}
+                for name in self.samples
+            },
+        }
+
+
+# Shared registry used by the cogs and utils
+metrics = Metrics()
@@ -0,0 +1,105 @@
+import bisect
+import collections
+import re
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _tokens(text):
+    return _WORD_RE.findall(text.lower())
+
+
+class TrackIndex:
+    """
+    A bounded in-memory prefix index over tracks the bot has already resolved.
+    Every word of a title is kept in a sorted list, so a prefix lookup is a
+    binary search. Results are ranked by guild plays, then global plays.
+    """
+
+    def __init__(self, max_tracks=5000):
+        self.max_tracks = max_tracks
+        self.tracks = {}  # video_id -> SavedTrack
+        self.urls = {}  # url -> video_id
+        self.plays = collections.Counter()  # video_id -> plays across all guilds
+        self.guild_plays = collections.defaultdict(collections.Counter)
+        self._words = []  # sorted (word, video_id) pairs
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def add(self, track, gid=None, played=True):
+        """Add a track to the index, counting a play for it if `played`."""
+        video_id = track.video_id
+        old = self.tracks.get(video_id)
+        if old is None:
+            if len(self.tracks) >= self.max_tracks:
+                self._evict()
+            self._index_words(track.title, video_id)
+        else:
+            self.urls.pop(old.url, None)
+            if old.title != track.title:
+                # Retitled video: re-index so no words of the old title linger
+                self._unindex_words(old.title, video_id)
+                self._index_words(track.title, video_id)
+        self.tracks[video_id] = track
+        self.urls[track.url] = video_id
+
+        if played:
+            self.plays[video_id] += 1
+            if gid is not None:
+                self.guild_plays[gid][video_id] += 1
+
+    def _index_words(self, title, video_id):
+        for word in set(_tokens(title)):
+            bisect.insort(self._words, (word, video_id))
+
+    def _unindex_words(self, title, video_id):
+        for word in set(_tokens(title)):
+            idx = bisect.bisect_left(self._words, (word, video_id))
+            if idx < len(self._words) and self._words[idx] == (word, video_id):
+                del self._words[idx]
+
+    def _evict(self):
+        """Drop the least played track to make room for a new one."""
+        victim = min(self.tracks, key=lambda v: self.plays[v])
+        track = self.tracks.pop(victim)
+        self.urls.pop(track.url, None)
+        self.plays.pop(victim, None)
+        for counts in self.guild_plays.values():
+            counts.pop(victim, None)
+        self._unindex_words(track.title, victim)
+
+    def lookup(self, url):
+        """Return the indexed track for a URL, if any."""
+        video_id = self.urls.get(url)
+        return self.tracks.get(video_id) if video_id else None
+
+    def search(self, text, gid=None, limit=25):
+        """Return up to `limit` tracks whose title words start with every word of `text`."""
+        words = _tokens(text)
+        guild_counts = self.guild_plays.get(gid, {})
+
+        def rank(video_id):
+            return (-guild_counts.get(video_id, 0), -self.plays[video_id])
+
+        if not words:
+            return [self.tracks[v] for v in sorted(self.tracks, key=rank)[:limit]]
+
+        # Collect candidates from the most specific word, then check the rest
+        prefix = max(words, key=len)
+        candidates = set()
+        idx = bisect.bisect_left(self._words, (prefix, ""))
+        while idx < len(self._words) and self._words[idx][0].startswith(prefix):
+            candidates.add(self._words[idx][1])
+            idx += 1
+
+        matches = []
+        for video_id in candidates:
+            track = self.tracks.get(video_id)
+            if track is None:
+                continue
+            title_words = _tokens(track.title)
+            if all(any(t.startswith(w) for t in title_words) for w in words):
+                matches.append(video_id)
+        matches.sort(key=rank)
+        return [self.tracks[v] for v in matches[:limit]]
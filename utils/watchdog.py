@@ -0,0 +1,109 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+from utils.metrics import metrics
+
+
+class LoopWatchdog:
+    """
+    Measures event loop lag with a heartbeat coroutine and, from a separate
+    thread, captures the loop thread's stack whenever the heartbeat is late
+    by more than `threshold` seconds. Stalls are attributed to the slash
+    command, listener or task whose code is on that stack.
+    """
+
+    def __init__(self, interval=0.1, threshold=0.25, stack_limit=12, max_labels=20):
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self.max_labels = max_labels
+        self.handlers = {}  # code object -> handler label
+        self._labels = set()  # Handler labels that have their own stall counter
+        self._last_tick = time.monotonic()
+        self._reported_tick = None
+        self._loop_thread = None
+        self._heartbeat_task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def register(self, cog):
+        """Learn the commands, listeners and tasks of a cog for attribution."""
+        for cmd in cog.walk_app_commands():
+            self.handlers[cmd.callback.__code__] = f"/{cmd.qualified_name}"
+        for name, listener in cog.get_listeners():
+            self.handlers[listener.__code__] = f"listener {name}"
+        for attr in vars(type(cog)).values():
+            coro = getattr(attr, "coro", None)
+            if coro is not None:
+                self.handlers[coro.__code__] = f"task {coro.__name__}"
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_tick = time.monotonic()
+            lag = self._last_tick - start - self.interval
+            metrics.observe("loop.lag_ms", max(lag, 0.0) * 1000)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            tick = self._last_tick
+            late = time.monotonic() - tick - self.interval
+            if late > self.threshold and tick != self._reported_tick:
+                # Report each stall once, while it is still happening
+                self._reported_tick = tick
+                self._report(late)
+
+    def _report(self, late):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        handler = self._attribute(frame, stack)
+        metrics.incr("loop.stalls")
+        # Fallback labels are file:function, so keep the number of counters bounded
+        if handler not in self._labels and len(self._labels) >= self.max_labels:
+            metrics.incr("loop.stalls.other")
+        else:
+            self._labels.add(handler)
+            metrics.incr(f"loop.stalls.{handler}")
+        print(
+            f"Event loop blocked for {late * 1000:.0f}+ ms in {handler}:\n"
+            + "".join(traceback.format_list(stack[-self.stack_limit :]))
+        )
+
+    def _attribute(self, frame, stack):
+        """Name the outermost registered handler on the stack, or the blocking code."""
+        handler = None
+        while frame is not None:
+            label = self.handlers.get(frame.f_code)
+            if label:
+                handler = label
+            frame = frame.f_back
+        if handler:
+            return handler
+        # Fall back to the innermost frame from our own code
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for entry in reversed(stack):
+            if entry.filename.startswith(root) and entry.filename != __file__:
+                return f"{os.path.relpath(entry.filename, root)}:{entry.name}"
+        return "unknown"
@@ -1,6 +1,14 @@
 import asyncio
 import discord
+from urllib.parse import parse_qs, urlsplit
 from yt_dlp import YoutubeDL
+from utils.ffmpeg import (
+    ProcessLimitError,
+    SupervisedFFmpegOpusAudio,
+    SupervisedFFmpegPCMAudio,
+)
+from utils.governor import governor
+from utils.library import SavedTrack
 
 # YTDL format options
 ytdl_format_options = {
@@ -20,31 +28,134 @@ ffmpeg_options = {
     "options": "-vn",
 }
 
+# Single YouTube client queried when resolving a stream. android_vr returns
+# plain stream URLs, so no JS player has to be downloaded and run.
+STREAM_PLAYER_CLIENT = "android_vr"
+
+
+def stream_options(player_client=STREAM_PLAYER_CLIENT):
+    """
+    Lightweight options for resolving the stream of one already chosen video:
+    one player client, audio-only formats, and no webpage, client config or
+    DASH/HLS manifest requests.
+    """
+    return {
+        **ytdl_format_options,
+        "format": "bestaudio[acodec=opus]/bestaudio[ext=m4a]/bestaudio",
+        "extractor_args": {
+            "youtube": {
+                "player_client": [player_client],
+                "player_skip": ["webpage", "configs"],
+                "skip": ["dash", "hls"],
+            }
+        },
+    }
+
+
+ytdl_stream_options = stream_options()
+
 # Initialize YoutubeDL
 ytdl = YoutubeDL(ytdl_format_options)
+ytdl_stream = YoutubeDL(ytdl_stream_options)
+
+
+def extract_flat(query):
+    """Resolve a query to its first entry without running format selection."""
+    if not query.startswith("http"):
+        query = f"ytsearch:{query}"
+    data = ytdl.extract_info(query, download=False, process=False)
+    if data and "entries" in data:
+        data = next(iter(data["entries"]), None)
+    return data
+
+
+def resolve_stream(url, stream_ytdl=None):
+    """
+    Resolve the stream URL of a single video with the lightweight profile,
+    falling back to full extraction if the shortcuts are not enough.
+    """
+    try:
+        data = (stream_ytdl or ytdl_stream).extract_info(url, download=False)
+        if data and "url" in data:
+            return data
+    except Exception as e:
+        print(f"Lightweight extraction failed for {url}, retrying: {e}")
+    return ytdl.extract_info(url, download=False)
+
+
+class TrackInfo:
+    """The few fields we use from a yt-dlp info dict, which is dropped after extraction."""
+
+    __slots__ = ("id", "title", "url", "webpage_url", "duration", "expires")
+
+    def __init__(self, id, title, url, webpage_url, duration=0, expires=None):
+        self.id = id
+        self.title = title
+        self.url = url
+        self.webpage_url = webpage_url
+        self.duration = duration
+        self.expires = expires  # Unix time the stream URL stops working, if known
+
+    @classmethod
+    def from_data(cls, data):
+        url = data["url"]
+        expire = parse_qs(urlsplit(url).query).get("expire")
+        return cls(
+            data.get("id"),
+            data.get("title"),
+            url,
+            data.get("webpage_url") or "",
+            int(data.get("duration") or 0),
+            int(expire[0]) if expire and expire[0].isdigit() else None,
+        )
+
+    def to_saved_track(self):
+        """Return a SavedTrack for the library, or None if the track has no ID."""
+        if not self.id or not self.webpage_url:
+            return None
+        return SavedTrack(self.id, self.webpage_url, self.title, self.duration)
 
 
 class YTDLSource(discord.PCMVolumeTransformer):
     """A class for streaming audio from YouTube."""
 
-    def __init__(self, source, *, data, volume=0.5):
+    def __init__(self, source, *, info, volume=0.5):
         super().__init__(source, volume)
-        self.data = data
-        self.title = data.get("title")
-        self.url = data.get("url")
+        self.info = info
+        self.title = info.title
+        self.url = info.url
+        self.gain = 1.0  # Loudness normalization gain, applied on top of volume
+        self._last_read = None
+
+    def read(self):
+        self._last_read = governor.time_frame(self._last_read)
+        return super().read()
 
     @classmethod
-    async def from_query(cls, query, *, loop=None, speed=1.0, filter_options=None):
-        """Create a YTDLSource from a search query or URL."""
+    async def from_query(
+        cls, query, *, loop=None, filter_options=None, gid=None, passthrough=None
+    ):
+        """Create a YTDLSource from a search query or URL.
+
+        `filter_options` is a compiled FFmpeg -af graph (see utils.filters).
+        `gid` is the guild the FFmpeg process is accounted to.
+        `passthrough` is called with the track's TrackInfo; if it returns
+        True, an unfiltered Opus stream is sent without decoding and a
+        YTDLPassthroughSource is returned instead.
+        """
         loop = loop or asyncio.get_event_loop()
 
-        if not query.startswith("http"):
-            query = f"ytsearch:{query}"
-
         try:
-            data = await loop.run_in_executor(
-                None, lambda: ytdl.extract_info(query, download=False)
-            )
+            if not query.startswith("http"):
+                # Pick the video with a flat search, so formats are only
+                # resolved for the one entry we actually play
+                entry = await loop.run_in_executor(None, lambda: extract_flat(query))
+                if not entry or not entry.get("url"):
+                    print(f"No search results for query: {query}")
+                    return None
+                query = entry["url"]
+
+            data = await loop.run_in_executor(None, lambda: resolve_stream(query))
 
             if data is None:
                 print(f"No results found for query: {query}")
@@ -61,22 +172,58 @@ class YTDLSource(discord.PCMVolumeTransformer):
                 print(f"Invalid data for query: {query}")
                 return None
 
-            ffmpeg_opts = ffmpeg_options.copy()
-            options = ffmpeg_opts.get("options", "")
+            # Keep only the fields we use; the full dict holds every format
+            is_opus = data.get("acodec") == "opus"
+            info = TrackInfo.from_data(data)
+            del data
 
-            if speed != 1.0:
-                options += f" -af atempo={speed}"
+            ffmpeg_opts = ffmpeg_options.copy()
+            if passthrough and not filter_options and is_opus and passthrough(info):
+                return YTDLPassthroughSource(
+                    SupervisedFFmpegOpusAudio(
+                        info.url, gid=gid, codec="opus", **ffmpeg_opts
+                    ),
+                    info=info,
+                )
 
             if filter_options:
-                if "-af" in options:
-                    options += f",{filter_options}"
-                else:
-                    options += f" -af {filter_options}"
-
-            ffmpeg_opts["options"] = options
+                ffmpeg_opts["options"] += f" -af {filter_options}"
 
-            return cls(discord.FFmpegPCMAudio(data["url"], **ffmpeg_opts), data=data)
+            return cls(
+                SupervisedFFmpegPCMAudio(info.url, gid=gid, **ffmpeg_opts),
+                info=info,
+            )
 
+        except ProcessLimitError:
+            # Not the track's fault; let the caller retry it later
+            raise
         except Exception as e:
             print(f"Error in from_query({query}): {e}")
             return None
+
+
+class YTDLPassthroughSource(discord.AudioSource):
+    """
+    Streams an Opus track as-is, skipping decode, volume scaling and
+    re-encode. Used when the host is overloaded; volume and loudness
+    changes only take effect from the next track.
+    """
+
+    def __init__(self, source, *, info):
+        self.original = source
+        self.info = info
+        self.title = info.title
+        self.url = info.url
+        self.gain = 1.0
+        self.volume = 1.0
+        self._last_read = None
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        self._last_read = governor.time_frame(self._last_read)
+        return self.original.read()
+
+    def cleanup(self):
+        self.original.cleanup()